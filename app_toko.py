@@ -1,17 +1,37 @@
 import os
 import json
-from datetime import datetime
-from flask import Flask, render_template, request, redirect, url_for, session, flash
+from datetime import datetime, timedelta
+from flask import Flask, render_template, request, redirect, url_for, session, flash, g, has_request_context, has_app_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as FlaskSQLAlchemySession
 from flask_login import LoginManager, UserMixin, login_user, logout_user, current_user, login_required
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
+from werkzeug.middleware.proxy_fix import ProxyFix
 from flask import make_response 
 import csv 
-from io import StringIO
+from io import StringIO, TextIOWrapper
 from flask_mail import Mail
-from threading import Thread
+from threading import Thread, Lock, Event, local
 from zoneinfo import ZoneInfo
+from collections import OrderedDict
+import hashlib
+import zlib
+import click
+from types import SimpleNamespace
+import sqlite3
+import tempfile
+import time
+from functools import wraps
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from urllib.request import urlopen
+from sqlalchemy import inspect, text, event
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
 
 # ===============================================
 # 1. SETUP KONFIGURASI APLIKASI
@@ -21,6 +41,13 @@ from zoneinfo import ZoneInfo
 toko_app = Flask(__name__)
 toko_app.config['SECRET_KEY'] = 'kunci_rahasia_dan_aman_sekali_toko_balokeren'
 
+# Jumlah proxy tepercaya di depan aplikasi (Render = 1). Hanya jika diisi,
+# header X-Forwarded-For dipakai untuk menentukan request.remote_addr.
+# Biarkan 0 saat aplikasi diakses langsung, agar IP tidak bisa dipalsukan klien.
+proxy_fix_x_for = int(os.environ.get('PROXY_FIX_X_FOR', '0'))
+if proxy_fix_x_for > 0:
+    toko_app.wsgi_app = ProxyFix(toko_app.wsgi_app, x_for=proxy_fix_x_for)
+
 # 🚀 MODIFIKASI UNTUK DEPLOYMENT LIVE
 # Ambil DATABASE_URL dari variabel lingkungan (untuk Render/PostgreSQL)
 # Jika tidak ada, gunakan SQLite lokal sebagai fallback
@@ -44,12 +71,38 @@ if database_url.startswith("postgres://"):
     database_url = database_url.replace("postgres://", "postgresql://", 1)
     
 toko_app.config['SQLALCHEMY_DATABASE_URI'] = database_url # <<< PERUBAHAN UTAMA
+
+# --- READ REPLICA (OPSIONAL) ---
+# Jika DATABASE_REPLICA_URL diisi, rute baca-saja (lihat decorator @read_replica)
+# membaca dari replica, sedangkan semua penulisan tetap ke database utama.
+# Untuk uji lokal bisa memakai dua file SQLite, misalnya salin shop.db ke replica.db
+# lalu jalankan dengan DATABASE_REPLICA_URL=sqlite:///replica.db
+replica_url = os.environ.get('DATABASE_REPLICA_URL')
+if replica_url and replica_url.startswith("postgres://"):
+    replica_url = replica_url.replace("postgres://", "postgresql://", 1)
+if replica_url:
+    toko_app.config['SQLALCHEMY_BINDS'] = {'replica': replica_url}
+
+# Setelah user menulis data (misal checkout), bacaannya dialihkan ke database utama
+# selama beberapa detik agar perubahan sendiri langsung terlihat (read-your-writes).
+toko_app.config['REPLICA_PIN_SECONDS'] = int(os.environ.get('REPLICA_PIN_SECONDS', '10'))
+
+# Pesanan yang lebih tua dari ini dipindahkan ke arsip oleh perintah `flask archive-orders`
+toko_app.config['ORDER_ARCHIVE_DAYS'] = int(os.environ.get('ORDER_ARCHIVE_DAYS', '180'))
 # ----------------------------------------
 
 toko_app.config['UPLOAD_FOLDER'] = os.path.join(toko_app.root_path, 'static/product_images') 
 toko_app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
-db = SQLAlchemy(toko_app)
+class RoutingSession(FlaskSQLAlchemySession):
+    """Session yang mengarahkan query baca ke replica saat rute menandainya."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_app_context() and g.get('use_replica'):
+            return self._db.engines['replica']
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+db = SQLAlchemy(toko_app, session_options={'class_': RoutingSession})
 login_manager = LoginManager(toko_app)
 login_manager.login_view = 'login' 
 
@@ -81,8 +134,12 @@ class Product(db.Model):
     stock = db.Column(db.Integer, default=0)
     description = db.Column(db.Text)
     image_file = db.Column(db.String(100), nullable=True, default='default.jpg')
+    sku = db.Column(db.String(64), unique=True, nullable=True) # Kode unik produk untuk import massal
 
 class Order(db.Model):
+    # AUTOINCREMENT: di SQLite, ID pesanan yang sudah dihapus/diarsipkan tidak dipakai ulang
+    __table_args__ = {'sqlite_autoincrement': True}
+
     id = db.Column(db.Integer, primary_key=True)
     customer_name = db.Column(db.String(100), nullable=False)
     total_amount = db.Column(db.Integer, nullable=False)
@@ -92,6 +149,54 @@ class Order(db.Model):
     proof_image = db.Column(db.String(255), nullable=True) # Nama file bukti pembayaran
     order_date = db.Column(db.DateTime, default=datetime.utcnow)
 
+class ImportJob(db.Model):
+    # Progres import produk massal yang berjalan di background (dibaca oleh halaman progres)
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(255), nullable=False)
+    status = db.Column(db.String(50), default='Berjalan') # Berjalan, Mengunduh Gambar, Selesai, Gagal
+    processed = db.Column(db.Integer, default=0)
+    saved = db.Column(db.Integer, default=0)
+    rejected = db.Column(db.Integer, default=0)
+    images_failed = db.Column(db.Integer, default=0)
+    messages = db.Column(db.Text, default='') # Pesan error per baris, dipisah baris baru
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+class ArchivedOrder(db.Model):
+    # Arsip pesanan lama: kolom untuk pencarian saja, isi lengkap pesanan dikompresi (zlib + JSON)
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, nullable=False, index=True) # ID pesanan asli
+    archive_month = db.Column(db.String(7), nullable=False, index=True) # Partisi per bulan, format 'YYYY-MM'
+    customer_name = db.Column(db.String(100), nullable=False, index=True)
+    order_date = db.Column(db.DateTime, nullable=False)
+    payload = db.Column(db.LargeBinary, nullable=False)
+
+    @classmethod
+    def from_order(cls, order):
+        data = {
+            'id': order.id,
+            'customer_name': order.customer_name,
+            'total_amount': order.total_amount,
+            'items_json': order.items_json,
+            'payment_method': order.payment_method,
+            'payment_status': order.payment_status,
+            'proof_image': order.proof_image,
+            'order_date': order.order_date.isoformat()
+        }
+        return cls(
+            order_id=order.id,
+            archive_month=order.order_date.strftime('%Y-%m'),
+            customer_name=order.customer_name,
+            order_date=order.order_date,
+            payload=zlib.compress(json.dumps(data).encode('utf-8'), 9)
+        )
+
+    # Kembalikan objek dengan atribut yang sama seperti Order (hanya untuk dibaca)
+    def to_order(self):
+        data = json.loads(zlib.decompress(self.payload).decode('utf-8'))
+        data['order_date'] = datetime.fromisoformat(data['order_date'])
+        return SimpleNamespace(**data)
+
 # ===============================================
 # 3. FUNGSI UTAMA DAN INIASI
 # ===============================================
@@ -103,11 +208,43 @@ def load_user(user_id):
 def is_user_admin():
     return current_user.is_authenticated and current_user.is_admin
 
+# Tambahkan kolom baru ke tabel lama (db.create_all() tidak mengubah tabel yang sudah ada)
+def upgrade_schema():
+    columns = [column['name'] for column in inspect(db.engine).get_columns('product')]
+    if 'sku' not in columns:
+        print("Menambahkan kolom 'sku' ke tabel product...")
+        with db.engine.begin() as conn:
+            conn.execute(text('ALTER TABLE product ADD COLUMN sku VARCHAR(64)'))
+            conn.execute(text('CREATE UNIQUE INDEX IF NOT EXISTS ix_product_sku ON product (sku)'))
+
+    # Tabel order SQLite lama dibuat tanpa AUTOINCREMENT, sehingga ID bisa dipakai ulang
+    # setelah pesanan terbaru dihapus/diarsipkan. Buat ulang tabelnya dengan AUTOINCREMENT.
+    if db.engine.dialect.name == 'sqlite':
+        with db.engine.begin() as conn:
+            table_sql = conn.execute(
+                text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'order'")
+            ).scalar()
+            if table_sql and 'AUTOINCREMENT' not in table_sql.upper():
+                print("Mengaktifkan AUTOINCREMENT pada tabel order...")
+                column_names = ', '.join(f'"{column.name}"' for column in Order.__table__.columns)
+                conn.execute(text('ALTER TABLE "order" RENAME TO order_old'))
+                Order.__table__.create(conn)
+                conn.execute(text(f'INSERT INTO "order" ({column_names}) SELECT {column_names} FROM order_old'))
+                conn.execute(text('DROP TABLE order_old'))
+
+                # Lanjutkan penomoran setelah ID terbesar, termasuk yang sudah ada di arsip
+                last_id = conn.execute(text(
+                    'SELECT MAX(id) FROM (SELECT id FROM "order" UNION ALL SELECT order_id FROM archived_order)'
+                )).scalar() or 0
+                conn.execute(text("DELETE FROM sqlite_sequence WHERE name = 'order'"))
+                conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES ('order', :seq)"), {'seq': last_id})
+
 def init_db():
     # Gunakan pengecekan yang lebih universal atau pindahkan ke dalam app_context
     with toko_app.app_context():
         # db.drop_all() # Hati-hati menggunakan ini di live!
         db.create_all() # Ini akan membuat tabel jika belum ada
+        upgrade_schema()
 
         print("Database dibuat, menambahkan Admin dan Produk awal (jika kosong)...")
 
@@ -137,6 +274,33 @@ def init_db():
         db.session.commit()
         print("Inisiasi DB Selesai.")
 
+# Pindahkan pesanan lama dari tabel Order ke ArchivedOrder, per batch
+def archive_orders(older_than_days, batch_size=1000):
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+
+    moved = 0
+    while True:
+        orders = Order.query.filter(Order.order_date < cutoff).order_by(Order.id).limit(batch_size).all()
+        if not orders:
+            break
+
+        db.session.add_all([ArchivedOrder.from_order(order) for order in orders])
+        order_ids = [order.id for order in orders]
+        db.session.execute(db.delete(Order).where(Order.id.in_(order_ids)))
+        db.session.commit()
+        moved += len(orders)
+
+    return moved
+
+@toko_app.cli.command('archive-orders')
+@click.option('--days', type=int, default=None, help='Umur minimal pesanan (hari) yang diarsipkan.')
+def archive_orders_command(days):
+    """Pindahkan pesanan lama ke tabel arsip."""
+    if days is None:
+        days = toko_app.config['ORDER_ARCHIVE_DAYS']
+    moved = archive_orders(days)
+    print(f"{moved} pesanan yang lebih tua dari {days} hari dipindahkan ke arsip.")
+
 # Helper untuk menghitung item di keranjang
 @toko_app.context_processor
 def cart_item_count_processor():
@@ -170,6 +334,580 @@ def to_wib(value):
 # Registrasi filter ke Jinja
 toko_app.jinja_env.filters['to_wib'] = to_wib
 
+# --- CACHE FRAGMEN TEMPLATE (KARTU PRODUK & BARIS PESANAN) ---
+class FragmentCache:
+    """Menyimpan potongan HTML hasil render di memori (per worker).
+
+    Key berbentuk tuple: (jenis, id_entitas, versi, ...). Versi dihitung dari
+    isi baris database, jadi worker lain yang belum menerima invalidasi tetap
+    tidak akan menampilkan data basi.
+    """
+
+    def __init__(self, max_entries=5000):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._keys_by_entity = {}
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            self._keys_by_entity.setdefault(key[:2], set()).add(key)
+            # Buang entri paling lama jika melebihi batas
+            while len(self._data) > self.max_entries:
+                old_key, _ = self._data.popitem(last=False)
+                self._discard_index(old_key)
+
+    def invalidate(self, kind, entity_id):
+        with self._lock:
+            for key in self._keys_by_entity.pop((kind, entity_id), set()):
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._keys_by_entity.clear()
+
+    def _discard_index(self, key):
+        keys = self._keys_by_entity.get(key[:2])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_entity[key[:2]]
+
+
+class FragmentCacheExtension(Extension):
+    """Tag Jinja: {% cache 'product', product.id, product|fragment_version %} ... {% endcache %}"""
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key_parts = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            key_parts.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        call = self.call_method('_cache_support', [nodes.List(key_parts)])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _cache_support(self, key_parts, caller):
+        cache = self.environment.fragment_cache
+        if cache is None:
+            return caller()
+
+        key = tuple(key_parts)
+        rv = cache.get(key)
+        if rv is None:
+            rv = caller()
+            cache.set(key, rv)
+        return rv
+
+
+# Versi fragmen = hash isi data, berubah otomatis setiap kali baris diupdate
+def fragment_version(obj):
+    if isinstance(obj, db.Model):
+        data = {column.name: getattr(obj, column.name) for column in obj.__table__.columns}
+    else:
+        data = obj
+    raw = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.md5(raw.encode('utf-8')).hexdigest()[:16]
+
+fragment_cache = FragmentCache()
+
+toko_app.jinja_env.add_extension(FragmentCacheExtension)
+toko_app.jinja_env.filters['fragment_version'] = fragment_version
+# Matikan dengan FRAGMENT_CACHE=False (misalnya saat debugging template)
+if os.environ.get('FRAGMENT_CACHE', 'True') == 'True':
+    toko_app.jinja_env.fragment_cache = fragment_cache
+
+# Bytecode cache: template yang sudah dikompilasi disimpan di disk,
+# sehingga worker Gunicorn baru tidak perlu mengkompilasi ulang.
+jinja_cache_dir = os.environ.get('JINJA_CACHE_DIR')
+if jinja_cache_dir:
+    os.makedirs(jinja_cache_dir, exist_ok=True)
+toko_app.jinja_env.bytecode_cache = FileSystemBytecodeCache(jinja_cache_dir)
+
+# --- ROUTING READ REPLICA ---
+# Setiap commit dari sebuah request menandai browser tersebut agar membaca dari
+# database utama untuk sementara waktu (replica mungkin belum menerima datanya).
+@event.listens_for(RoutingSession, 'after_commit')
+def pin_reads_to_primary(db_session):
+    if has_request_context():
+        session['replica_pin_until'] = time.time() + toko_app.config['REPLICA_PIN_SECONDS']
+
+def replica_allowed():
+    if 'replica' not in toko_app.config.get('SQLALCHEMY_BINDS', {}):
+        return False
+    return session.get('replica_pin_until', 0) < time.time()
+
+# Decorator untuk rute baca-saja: query dijalankan di replica (jika tersedia)
+def read_replica(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.use_replica = replica_allowed()
+        return view(*args, **kwargs)
+    return wrapper
+
+# --- PENYIMPANAN BERSAMA ANTAR WORKER GUNICORN (SQLITE LOKAL) ---
+class SQLiteStore:
+    """Basis penyimpanan di file SQLite lokal, dipakai bersama semua worker di mesin yang sama."""
+    schema = ()
+
+    def __init__(self, path):
+        self.path = path
+        self._local = local()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            for statement in self.schema:
+                conn.execute(statement)
+            self._local.conn = conn
+        return conn
+
+# --- RATE LIMITING (TOKEN BUCKET) ---
+class SQLiteTokenBucket(SQLiteStore):
+    """Token bucket per IP; setiap pengambilan token dilakukan dalam transaksi
+    BEGIN IMMEDIATE sehingga aman dipakai banyak proses sekaligus.
+    """
+    schema = (
+        'CREATE TABLE IF NOT EXISTS rate_limit ('
+        ' bucket TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)',
+    )
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._calls = 0
+
+    def take(self, bucket, rate, burst):
+        """Ambil satu token. Return (diizinkan, detik_tunggu)."""
+        conn = self._connect()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT tokens, updated FROM rate_limit WHERE bucket = ?', (bucket,)
+            ).fetchone()
+            tokens = burst if row is None else min(burst, row[0] + (now - row[1]) * rate)
+
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            conn.execute(
+                'INSERT INTO rate_limit (bucket, tokens, updated) VALUES (?, ?, ?) '
+                'ON CONFLICT(bucket) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated',
+                (bucket, tokens, now)
+            )
+
+            # Bersihkan bucket yang sudah lama tidak dipakai (sudah penuh kembali)
+            self._calls += 1
+            if self._calls % 1000 == 0:
+                conn.execute('DELETE FROM rate_limit WHERE updated < ?', (now - 3600,))
+
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        return allowed, 0 if allowed else (1 - tokens) / rate
+
+rate_limiter = SQLiteTokenBucket(
+    os.environ.get('RATE_LIMIT_DB', os.path.join(tempfile.gettempdir(), 'toko_rate_limit.db'))
+)
+toko_app.config['RATE_LIMIT_ENABLED'] = os.environ.get('RATE_LIMIT_ENABLED', 'True') == 'True'
+
+# Decorator: batasi `rate` request/detik per IP, dengan lonjakan maksimal `burst`
+def rate_limit(name, rate, burst, methods=None):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if toko_app.config['RATE_LIMIT_ENABLED'] and (methods is None or request.method in methods):
+                try:
+                    allowed, retry_after = rate_limiter.take(f"{name}:{request.remote_addr}", rate, burst)
+                except sqlite3.Error as e:
+                    # Jika penyimpanan rate limit bermasalah, jangan blokir pengunjung
+                    print(f"Rate Limit Error: {e}")
+                    allowed, retry_after = True, 0
+
+                if not allowed:
+                    response = make_response("Terlalu banyak permintaan. Silakan coba lagi sebentar lagi.", 429)
+                    response.headers['Retry-After'] = str(int(retry_after) + 1)
+                    return response
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# --- REQUEST COALESCING (SINGLE-FLIGHT) ---
+class SingleFlight:
+    """Gabungkan pemanggilan identik yang berjalan bersamaan di satu worker.
+
+    Thread pertama (leader) menjalankan fungsi; thread lain dengan key yang
+    sama menunggu dan memakai hasil yang sama. Hanya berguna untuk worker
+    ber-thread; antar proses dipakai SQLiteSharedCache di bawah.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = {'done': Event(), 'result': None, 'error': None}
+                self._calls[key] = call
+
+        if not leader:
+            call['done'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            return call['result']
+
+        try:
+            call['result'] = fn()
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['done'].set()
+        return call['result']
+
+single_flight = SingleFlight()
+
+class SQLiteSharedCache(SQLiteStore):
+    """Hasil query (JSON) yang dibagi antar worker untuk waktu singkat.
+
+    Saat cache kosong atau kadaluarsa, hanya worker yang berhasil mengambil
+    baris lock yang menjalankan query; worker lain menunggu hasilnya ditulis.
+    Invalidasi menaikkan `version`, sehingga hasil query yang dimulai sebelum
+    invalidasi tidak akan disimpan.
+    """
+    schema = (
+        'CREATE TABLE IF NOT EXISTS shared_cache ('
+        ' name TEXT PRIMARY KEY, payload TEXT, updated REAL NOT NULL, version INTEGER NOT NULL)',
+        'CREATE TABLE IF NOT EXISTS shared_lock (name TEXT PRIMARY KEY, expires REAL NOT NULL)',
+    )
+
+    def __init__(self, path, lock_timeout=5.0):
+        super().__init__(path)
+        self.lock_timeout = lock_timeout
+
+    def _read(self, conn, name, ttl):
+        row = conn.execute('SELECT payload, updated FROM shared_cache WHERE name = ?', (name,)).fetchone()
+        if row is not None and row[0] is not None and time.time() - row[1] < ttl:
+            return json.loads(row[0])
+        return None
+
+    def _acquire(self, conn, name):
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT expires FROM shared_lock WHERE name = ?', (name,)).fetchone()
+            acquired = row is None or row[0] < now
+            if acquired:
+                conn.execute(
+                    'INSERT INTO shared_lock (name, expires) VALUES (?, ?) '
+                    'ON CONFLICT(name) DO UPDATE SET expires = excluded.expires',
+                    (name, now + self.lock_timeout)
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return acquired
+
+    def get_or_load(self, name, ttl, loader):
+        conn = self._connect()
+        deadline = time.time() + self.lock_timeout
+        while True:
+            result = self._read(conn, name, ttl)
+            if result is not None:
+                return result
+            if self._acquire(conn, name):
+                break
+            if time.time() > deadline:
+                # Pemegang lock macet/mati: jalankan query sendiri
+                return loader()
+            time.sleep(0.02)
+
+        try:
+            # Cek ulang: worker lain mungkin baru saja selesai mengisi cache
+            result = self._read(conn, name, ttl)
+            if result is not None:
+                return result
+
+            conn.execute('INSERT OR IGNORE INTO shared_cache (name, payload, updated, version) VALUES (?, NULL, 0, 0)',
+                         (name,))
+            version = conn.execute('SELECT version FROM shared_cache WHERE name = ?', (name,)).fetchone()[0]
+            result = loader()
+            conn.execute('UPDATE shared_cache SET payload = ?, updated = ? WHERE name = ? AND version = ?',
+                         (json.dumps(result), time.time(), name, version))
+        finally:
+            conn.execute('DELETE FROM shared_lock WHERE name = ?', (name,))
+        return result
+
+    def invalidate(self, prefix):
+        self._connect().execute(
+            'UPDATE shared_cache SET payload = NULL, version = version + 1 WHERE name LIKE ?', (prefix + '%',)
+        )
+
+shared_cache = SQLiteSharedCache(
+    os.environ.get('SHARED_CACHE_DB', os.path.join(tempfile.gettempdir(), 'toko_shared_cache.db'))
+)
+# Berapa detik katalog boleh dipakai ulang oleh semua worker (perubahan produk langsung menghapusnya)
+toko_app.config['CATALOGUE_CACHE_SECONDS'] = float(os.environ.get('CATALOGUE_CACHE_SECONDS', '5'))
+
+# Katalog dibaca sebagai dict biasa (bukan objek ORM) agar aman dibagi antar thread/session
+def load_catalogue():
+    rows = db.session.execute(db.select(Product.__table__).order_by(Product.id)).mappings().all()
+    return [dict(row) for row in rows]
+
+# Katalog dari cache bersama; lonjakan request di banyak worker = satu query database
+def load_shared_catalogue():
+    name = 'catalogue:replica' if g.use_replica else 'catalogue:primary'
+    try:
+        return shared_cache.get_or_load(name, toko_app.config['CATALOGUE_CACHE_SECONDS'], load_catalogue)
+    except sqlite3.Error as e:
+        print(f"Shared Cache Error: {e}")
+        return load_catalogue()
+
+# Dipanggil setelah setiap perubahan produk/stok
+def invalidate_catalogue():
+    try:
+        shared_cache.invalidate('catalogue')
+    except sqlite3.Error as e:
+        print(f"Shared Cache Error: {e}")
+
+# --- IMPORT PRODUK MASSAL (CSV / JSONL) ---
+IMPORT_BATCH_SIZE = 1000
+IMPORT_IMAGE_WORKERS = 8
+IMPORT_MAX_ERRORS = 50
+IMPORT_IMAGE_MAX_BYTES = 5 * 1024 * 1024
+IMPORT_IMAGE_TYPES = {'image/jpeg': '.jpg', 'image/png': '.png', 'image/gif': '.gif', 'image/webp': '.webp'}
+
+# Baca file upload baris per baris, tanpa memuat seluruh isi file ke memori
+def iter_import_rows(import_file, filename):
+    stream = TextIOWrapper(import_file, encoding='utf-8-sig', newline='')
+    if filename.lower().endswith(('.jsonl', '.ndjson')):
+        for line_no, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield line_no, json.loads(line)
+            except ValueError:
+                yield line_no, None
+    else:
+        reader = csv.DictReader(stream)
+        for raw in reader:
+            yield reader.line_num, raw
+
+# Validasi satu baris. Return (data_produk, url_gambar, pesan_error)
+def parse_import_row(raw):
+    if not isinstance(raw, dict):
+        return None, None, 'format baris tidak valid'
+
+    sku = str(raw.get('sku') or '').strip()
+    name = str(raw.get('name') or '').strip()
+    if not sku or len(sku) > 64:
+        return None, None, 'sku kosong atau lebih dari 64 karakter'
+    if not name or len(name) > 100:
+        return None, None, 'name kosong atau lebih dari 100 karakter'
+
+    try:
+        price = int(raw.get('price'))
+        stock = int(raw.get('stock') or 0)
+    except (TypeError, ValueError):
+        return None, None, 'price dan stock harus berupa angka'
+    if price < 1 or stock < 0:
+        return None, None, 'price minimal 1 dan stock tidak boleh negatif'
+
+    # Gambar boleh berupa URL (akan diunduh) atau nama file yang sudah ada di folder upload
+    image = str(raw.get('image') or '').strip()
+    image_url = None
+    if image.startswith(('http://', 'https://')):
+        image_url = image
+        image_file = import_image_filename(image_url)
+    else:
+        image_file = secure_filename(image) or 'default.jpg'
+
+    product = {
+        'sku': sku,
+        'name': name,
+        'price': price,
+        'stock': stock,
+        'description': str(raw.get('description') or ''),
+        'image_file': image_file
+    }
+    return product, image_url, None
+
+# Upsert berdasarkan SKU: INSERT ... ON CONFLICT (sku) DO UPDATE
+def upsert_products(rows):
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        insert = postgresql_insert
+    elif dialect == 'sqlite':
+        insert = sqlite_insert
+    else:
+        raise RuntimeError(f"Import massal tidak mendukung database '{dialect}'.")
+
+    stmt = insert(Product.__table__).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['sku'],
+        set_={column: stmt.excluded[column] for column in ('name', 'price', 'stock', 'description', 'image_file')}
+    )
+    db.session.execute(stmt)
+    db.session.commit()
+
+# Nama file gambar hasil unduhan diambil dari hash URL-nya, sehingga URL berbeda
+# tidak pernah menimpa satu sama lain (atau gambar produk lain / default.jpg).
+def import_image_filename(url):
+    extension = os.path.splitext(urlparse(url).path)[1].lower()
+    if extension == '.jpeg' or extension not in IMPORT_IMAGE_TYPES.values():
+        extension = '.jpg'
+    return 'import_' + hashlib.sha1(url.encode('utf-8')).hexdigest()[:20] + extension
+
+# Unduh gambar produk ke folder upload (dijalankan paralel di thread pool)
+def fetch_product_image(url, image_file):
+    file_path = os.path.join(toko_app.config['UPLOAD_FOLDER'], image_file)
+    if os.path.exists(file_path):
+        return True # Sudah pernah diunduh dari URL yang sama
+
+    tmp_path = file_path + '.part'
+    try:
+        with urlopen(url, timeout=10) as resp:
+            content_type = resp.headers.get_content_type()
+            if content_type not in IMPORT_IMAGE_TYPES:
+                raise ValueError(f"bukan file gambar ({content_type})")
+            if int(resp.headers.get('Content-Length') or 0) > IMPORT_IMAGE_MAX_BYTES:
+                raise ValueError("ukuran gambar melebihi batas")
+
+            size = 0
+            with open(tmp_path, 'wb') as f:
+                while True:
+                    chunk = resp.read(64 * 1024)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > IMPORT_IMAGE_MAX_BYTES:
+                        raise ValueError("ukuran gambar melebihi batas")
+                    f.write(chunk)
+
+        os.replace(tmp_path, file_path)
+        return True
+    except Exception as e:
+        print(f"Image Import Error ({url}): {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+
+# Proses import lengkap; progres ditulis ke baris ImportJob setiap selesai satu batch
+def run_product_import(job, import_file, filename):
+    batch = {} # sku -> data produk (SKU ganda dalam satu batch: baris terakhir yang dipakai)
+    image_jobs = {} # url gambar -> (future, daftar sku)
+    errors = []
+    # Dihitung di variabel lokal: rollback meng-expire `job`, nilainya tidak boleh hilang
+    processed = saved = rejected = 0
+    line_no = 0
+
+    # Commit satu batch produk bersama progres job
+    def save_batch():
+        job.processed, job.rejected, job.saved = processed, rejected, saved + len(batch)
+        upsert_products(list(batch.values()))
+        return saved + len(batch)
+
+    with ThreadPoolExecutor(max_workers=IMPORT_IMAGE_WORKERS) as executor:
+        try:
+            for line_no, raw in iter_import_rows(import_file, filename):
+                processed += 1
+                product, image_url, error = parse_import_row(raw)
+                if error:
+                    rejected += 1
+                    if len(errors) < IMPORT_MAX_ERRORS:
+                        errors.append(f"Baris {line_no}: {error}")
+                    continue
+
+                if image_url:
+                    if image_url not in image_jobs:
+                        image_jobs[image_url] = (
+                            executor.submit(fetch_product_image, image_url, product['image_file']), []
+                        )
+                    image_jobs[image_url][1].append(product['sku'])
+
+                batch[product['sku']] = product
+                if len(batch) >= IMPORT_BATCH_SIZE:
+                    saved = save_batch()
+                    batch = {}
+
+            if batch:
+                saved = save_batch()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Import Error: {e}")
+            # Gambar yang belum mulai diunduh tidak perlu ditunggu lagi
+            executor.shutdown(cancel_futures=True)
+            job.processed, job.rejected, job.saved = processed, rejected, saved
+            job.status = 'Gagal'
+            job.messages = "\n".join(errors + [f"Import dihentikan pada baris {line_no} "
+                                                f"({saved} produk sudah tersimpan): {e}"])
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+            return
+        finally:
+            import_file.close()
+
+        if image_jobs:
+            job.status = 'Mengunduh Gambar'
+            db.session.commit()
+
+        # Produk yang gambarnya gagal diunduh dikembalikan ke gambar default
+        failed_skus = []
+        for future, skus in image_jobs.values():
+            if not future.result():
+                failed_skus.extend(skus)
+
+    for i in range(0, len(failed_skus), IMPORT_BATCH_SIZE):
+        chunk = failed_skus[i:i + IMPORT_BATCH_SIZE]
+        db.session.execute(db.update(Product).where(Product.sku.in_(chunk)).values(image_file='default.jpg'))
+
+    job.processed, job.rejected, job.saved = processed, rejected, saved
+    job.images_failed = len(failed_skus)
+    job.messages = "\n".join(errors)
+    job.status = 'Selesai'
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+
+    fragment_cache.clear()
+    invalidate_catalogue()
+
+# Dijalankan di thread terpisah agar request admin (dan worker Gunicorn) tidak tertahan
+def run_import_job(app, job_id, import_file, filename):
+    with app.app_context():
+        job = db.session.get(ImportJob, job_id)
+        try:
+            run_product_import(job, import_file, filename)
+        except Exception as e:
+            db.session.rollback()
+            print(f"Import Error: {e}")
+            job.status = 'Gagal'
+            job.messages = f"Import gagal: {e}"
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
 
 # ===============================================
 # 4. RUTE & LOGIKA APLIKASI
@@ -224,6 +962,7 @@ def signup():
 
 # --- RUTE: LOGIN ---
 @toko_app.route('/login', methods=['GET', 'POST'])
+@rate_limit('login', rate=0.2, burst=5, methods=['POST'])
 def login():
     if current_user.is_authenticated:
         return redirect(url_for('index'))
@@ -252,8 +991,10 @@ def logout():
 
 # --- RUTE: HALAMAN UTAMA (INDEX/TOKO) ---
 @toko_app.route('/')
+@rate_limit('index', rate=5, burst=20)
+@read_replica
 def index():
-    products = Product.query.all()
+    products = single_flight.do(('catalogue', g.use_replica), load_shared_catalogue)
     return render_template('index.html', products=products)
 
 # --- RUTE: TAMBAH PRODUK BARU ---
@@ -290,12 +1031,51 @@ def add_product():
         )
         db.session.add(new_product)
         db.session.commit()
+        invalidate_catalogue()
         
         flash(f'Produk "{name}" berhasil ditambahkan!', 'success')
         return redirect(url_for('index'))
     
     return render_template('add_product.html')
 
+# --- RUTE: IMPORT PRODUK MASSAL (ADMIN) ---
+@toko_app.route('/admin/import_products', methods=['GET', 'POST'])
+@login_required
+def import_products():
+    if not is_user_admin():
+        return "Akses Ditolak: Hanya Admin yang dapat mengimpor produk.", 403
+
+    if request.method == 'POST':
+        uploaded_file = request.files.get('file')
+        if not uploaded_file or uploaded_file.filename == '':
+            flash('Pilih file CSV atau JSONL terlebih dahulu.', 'error')
+            return redirect(url_for('import_products'))
+
+        # Salin ke file sementara milik thread import: file upload Werkzeug
+        # ditutup begitu request ini selesai.
+        import_file = tempfile.TemporaryFile()
+        shutil.copyfileobj(uploaded_file.stream, import_file)
+        import_file.seek(0)
+
+        job = ImportJob(filename=secure_filename(uploaded_file.filename) or 'import')
+        db.session.add(job)
+        db.session.commit()
+
+        Thread(target=run_import_job, args=(toko_app, job.id, import_file, uploaded_file.filename)).start()
+        return redirect(url_for('import_progress', job_id=job.id))
+
+    return render_template('import_products.html')
+
+# --- RUTE: PROGRES IMPORT PRODUK (ADMIN) ---
+@toko_app.route('/admin/import_products/<int:job_id>')
+@login_required
+def import_progress(job_id):
+    if not is_user_admin():
+        return "Akses Ditolak: Hanya Admin yang dapat mengimpor produk.", 403
+
+    job = ImportJob.query.get_or_404(job_id)
+    return render_template('import_products.html', job=job)
+
 # --- RUTE: EDIT PRODUK (ADMIN) ---
 @toko_app.route('/edit_product/<int:product_id>', methods=['GET', 'POST'])
 @login_required
@@ -321,6 +1101,8 @@ def edit_product(product_id):
         # ---------------------------------------------------
         
         db.session.commit()
+        fragment_cache.invalidate('product', product.id)
+        invalidate_catalogue()
         flash(f'Produk "{product.name}" berhasil diperbarui!', 'success')
         return redirect(url_for('index')) 
 
@@ -335,19 +1117,26 @@ def delete_product(product_id):
 
     product = Product.query.get_or_404(product_id)
     
-    # Opsional: Hapus file gambar dari server
-    if product.image_file != 'default.jpg':
+    # Opsional: Hapus file gambar dari server, kecuali masih dipakai produk lain
+    # (gambar hasil import massal bisa dipakai bersama oleh beberapa SKU)
+    image_shared = Product.query.filter(
+        Product.image_file == product.image_file, Product.id != product.id
+    ).first() is not None
+    if product.image_file != 'default.jpg' and not image_shared:
         file_path = os.path.join(toko_app.config['UPLOAD_FOLDER'], product.image_file)
         if os.path.exists(file_path):
             os.remove(file_path)
 
     db.session.delete(product)
     db.session.commit()
+    fragment_cache.invalidate('product', product_id)
+    invalidate_catalogue()
     flash(f'Produk "{product.name}" berhasil dihapus.', 'success')
     return redirect(url_for('index'))
 
 # --- RUTE: TAMBAH KE KERANJANG ---
 @toko_app.route('/add_to_cart/<int:product_id>')
+@rate_limit('add_to_cart', rate=2, burst=10)
 def add_to_cart(product_id):
     product = Product.query.get_or_404(product_id)
     quantity = 1 
@@ -465,6 +1254,9 @@ def checkout():
                     return redirect(url_for('cart'))
             
             db.session.commit() 
+            for item in cart_items:
+                fragment_cache.invalidate('product', item['id'])
+            invalidate_catalogue()
         
         except Exception as e:
             db.session.rollback()
@@ -505,15 +1297,8 @@ def qris_info():
     return render_template('qris_info.html')
 
 
-# --- RUTE: PESANAN SAYA (USER) ---
-@toko_app.route('/my_orders')
-@login_required
-def my_orders():
-    orders = Order.query.filter_by(customer_name=current_user.email).order_by(Order.order_date.desc()).all()
-    
-    payment_info = session.pop('payment_info', None)
-    session.modified = True 
-
+# Ubah daftar pesanan (Order atau hasil ArchivedOrder.to_order()) menjadi data untuk template
+def parse_my_orders(orders):
     parsed_orders = []
     for order in orders:
         
@@ -535,56 +1320,113 @@ def my_orders():
             'payment_method': order.payment_method,
             'payment_status': order.payment_status
         })
+    return parsed_orders
 
-    return render_template('my_orders.html', orders=parsed_orders, payment_info=payment_info)
+# Nomor HP semua customer dalam satu query (bukan satu query per pesanan)
+def customer_phone_numbers(orders):
+    emails = {order.customer_name for order in orders}
+    if not emails:
+        return {}
+    customers = User.query.filter(User.email.in_(emails)).all()
+    return {customer.email: customer.phone_number for customer in customers}
+
+# Dipanggil dari template admin_orders.html hanya jika baris pesanan belum ada di cache fragmen
+def parse_admin_order(order, phone_number, archived=False):
+    if isinstance(order, ArchivedOrder):
+        order = order.to_order()
+
+    safe_total_amount = order.total_amount if order.total_amount is not None else 0
+
+    # --- 1. Hitung Total Unik ---
+    payment_suffix = order.id % 1000 
+    final_unique_amount = safe_total_amount + payment_suffix 
+
+    # --- TAMBAHAN: Buat Order Code ---
+    order_code = order.order_date.strftime(f"TKO%y%m%d-{order.id}") 
+
+    # --- 2. Parse Items ---
+    items = json.loads(order.items_json)
+    
+    return {
+        'id': order.id,
+        'order_code': order_code, 
+        'order_date': order.order_date,
+        'customer_name': order.customer_name,
+        'phone_number': phone_number,  
+        'total_amount': safe_total_amount, 
+        'total_unique_amount': final_unique_amount, 
+        'order_items': items,
+        'payment_method': order.payment_method,
+        'payment_status': order.payment_status,
+        'archived': archived
+    }
+
+# --- RUTE: PESANAN SAYA (USER) ---
+@toko_app.route('/my_orders')
+@login_required
+@read_replica
+def my_orders():
+    orders = Order.query.filter_by(customer_name=current_user.email).order_by(Order.order_date.desc()).all()
+    
+    payment_info = session.pop('payment_info', None)
+    session.modified = True 
+
+    has_archive = ArchivedOrder.query.filter_by(customer_name=current_user.email).first() is not None
+
+    return render_template('my_orders.html', orders=parse_my_orders(orders), payment_info=payment_info,
+                           has_archive=has_archive)
+
+# --- RUTE: ARSIP PESANAN SAYA (USER) ---
+@toko_app.route('/my_orders/archive')
+@login_required
+@read_replica
+def my_orders_archive():
+    archived = ArchivedOrder.query.filter_by(customer_name=current_user.email) \
+        .order_by(ArchivedOrder.order_date.desc()).all()
+    orders = [archived_order.to_order() for archived_order in archived]
+
+    return render_template('my_orders.html', orders=parse_my_orders(orders), payment_info=None,
+                           archived=True)
 
 
 # --- RUTE: ADMIN DASHBOARD (MENGELOLA PESANAN) ---
 @toko_app.route('/admin/orders')
 @login_required
+@read_replica
 def admin_orders():
     if not is_user_admin():
         return "Akses Ditolak: Anda bukan Admin.", 403
 
     orders = Order.query.order_by(Order.order_date.desc()).all()
 
-    parsed_orders = []
-    for order in orders:
-        # --- 1. Ambil Data Customer (Enrichment) ---
-        customer = User.query.filter_by(email=order.customer_name).first()
-        phone_number = customer.phone_number if customer else 'N/A'
-        
-        safe_total_amount = order.total_amount if order.total_amount is not None else 0
+    # Baris pesanan di-parse di template (parse_admin_order) hanya saat cache fragmen kosong
+    return render_template('admin_orders.html', orders=orders, phone_numbers=customer_phone_numbers(orders),
+                           parse_admin_order=parse_admin_order, archived=False)
 
-        # --- 2. Hitung Total Unik ---
-        payment_suffix = order.id % 1000 
-        final_unique_amount = safe_total_amount + payment_suffix 
+# --- RUTE: ARSIP PESANAN (ADMIN) ---
+@toko_app.route('/admin/orders/archive')
+@login_required
+@read_replica
+def admin_orders_archive():
+    if not is_user_admin():
+        return "Akses Ditolak: Anda bukan Admin.", 403
 
-        # --- TAMBAHAN: Buat Order Code ---
-        order_code = order.order_date.strftime(f"TKO%y%m%d-{order.id}") 
+    # Arsip ditampilkan per bulan agar tidak memuat seluruh riwayat sekaligus
+    months = [row[0] for row in db.session.query(ArchivedOrder.archive_month).distinct()
+              .order_by(ArchivedOrder.archive_month.desc())]
+    month = request.args.get('month') or (months[0] if months else None)
 
-        # --- 3. Parse Items ---
-        items = json.loads(order.items_json)
-        
-        parsed_orders.append({
-            'id': order.id,
-            'order_code': order_code, 
-            'order_date': order.order_date,
-            'customer_name': order.customer_name,
-            'phone_number': phone_number,  
-            'total_amount': safe_total_amount, 
-            'total_unique_amount': final_unique_amount, 
-            'order_items': items,
-            'payment_method': order.payment_method,
-            'payment_status': order.payment_status
-        })
+    # Isi arsip baru didekompresi di parse_admin_order, saat baris belum ada di cache fragmen
+    orders = ArchivedOrder.query.filter_by(archive_month=month).order_by(ArchivedOrder.order_date.desc()).all()
 
-    return render_template('admin_orders.html', orders=parsed_orders)
+    return render_template('admin_orders.html', orders=orders, phone_numbers=customer_phone_numbers(orders),
+                           parse_admin_order=parse_admin_order, archived=True, months=months, month=month)
 # app_toko.py (Tambahkan di bagian rute Admin)
 
 # --- RUTE: DAFTAR USER (ADMIN) ---
 @toko_app.route('/admin/users')
 @login_required
+@read_replica
 def admin_users():
     # Pengecekan Wajib: Pastikan hanya Admin yang bisa akses
     if not is_user_admin():
@@ -603,6 +1445,7 @@ def admin_users():
 # --- RUTE BARU: EKSPOR DATA USER KE CSV ---
 @toko_app.route('/admin/users/export', methods=['GET'])
 @login_required
+@read_replica
 def export_users_csv():
     # 1. Pengecekan Wajib Admin
     if not is_user_admin():
@@ -691,6 +1534,7 @@ def update_order_status(order_id):
     if new_status:
         order.payment_status = new_status
         db.session.commit()
+        fragment_cache.invalidate('order', order_id)
         flash(f'Status pesanan #{order_id} berhasil diupdate menjadi {new_status}', 'success')
     
     return redirect(url_for('admin_orders'))
@@ -711,6 +1555,7 @@ def delete_order(order_id):
         # 3. Hapus Pesanan
         db.session.delete(order)
         db.session.commit()
+        fragment_cache.invalidate('order', order_id)
         flash(f'Pesanan #{order_id} berhasil dihapus dari database.', 'success')
     else:
         flash(f'Pesanan dengan ID #{order_id} tidak ditemukan.', 'danger')
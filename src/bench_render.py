@@ -0,0 +1,73 @@
+import sys, os, json, time, tempfile
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+# Benchmark render halaman index & admin_orders, sebelum dan sesudah cache fragmen.
+# Jalankan: python src/bench_render.py [jumlah_produk] [jumlah_pesanan] [ulangan]
+JUMLAH_PRODUK = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+JUMLAH_PESANAN = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+ULANGAN = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+
+tmp_dir = tempfile.mkdtemp(prefix='bench_toko_')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmp_dir, 'bench.db')
+os.environ['JINJA_CACHE_DIR'] = os.path.join(tmp_dir, 'jinja_cache')
+os.environ['RATE_LIMIT_ENABLED'] = 'False'
+os.environ['SHARED_CACHE_DB'] = os.path.join(tmp_dir, 'shared_cache.db')
+
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+from app_toko import toko_app, db, User, Product, Order, fragment_cache
+
+ADMIN_EMAIL = 'bench@toko.com'
+ADMIN_PASSWORD = 'bench'
+
+def seed():
+    with toko_app.app_context():
+        db.create_all()
+        admin = User(email=ADMIN_EMAIL, phone_number='08123456789', is_admin=True)
+        admin.set_password(ADMIN_PASSWORD)
+        db.session.add(admin)
+        for i in range(JUMLAH_PRODUK):
+            db.session.add(Product(name=f'Produk {i}', price=10000 + i, stock=i % 7,
+                                   description='Deskripsi produk ' * 5, image_file='default.jpg'))
+        items = [{'id': 1, 'name': 'Produk 1', 'price': 10001, 'quantity': 2, 'keterangan': 'XL'},
+                 {'id': 2, 'name': 'Produk 2', 'price': 10002, 'quantity': 1}]
+        for i in range(JUMLAH_PESANAN):
+            db.session.add(Order(customer_name=ADMIN_EMAIL, total_amount=30004,
+                                 items_json=json.dumps(items), payment_method='QRIS'))
+        db.session.commit()
+
+def time_page(client, path):
+    client.get(path)  # pemanasan (kompilasi template & isi cache)
+    start = time.perf_counter()
+    for _ in range(ULANGAN):
+        client.get(path)
+    return (time.perf_counter() - start) / ULANGAN * 1000
+
+def time_compile(bytecode_cache):
+    env = Environment(loader=FileSystemLoader(os.path.join(toko_app.root_path, 'templates')),
+                      extensions=[type(ext) for ext in toko_app.jinja_env.extensions.values()],
+                      bytecode_cache=bytecode_cache)
+    env.filters.update(toko_app.jinja_env.filters)
+    start = time.perf_counter()
+    for name in env.list_templates(extensions=['html']):
+        env.get_template(name)
+    return (time.perf_counter() - start) * 1000
+
+if __name__ == '__main__':
+    seed()
+    client = toko_app.test_client()
+    client.post('/login', data={'email': ADMIN_EMAIL, 'password': ADMIN_PASSWORD})
+
+    print(f"Produk: {JUMLAH_PRODUK}, Pesanan: {JUMLAH_PESANAN}, Ulangan: {ULANGAN}")
+    for path in ['/', '/admin/orders']:
+        toko_app.jinja_env.fragment_cache = None
+        before = time_page(client, path)
+        fragment_cache.clear()
+        toko_app.jinja_env.fragment_cache = fragment_cache
+        after = time_page(client, path)
+        print(f"{path:<15} tanpa cache: {before:8.2f} ms | dengan cache fragmen: {after:8.2f} ms")
+
+    bytecode_cache = FileSystemBytecodeCache(os.environ['JINJA_CACHE_DIR'])
+    cold = time_compile(None)
+    time_compile(bytecode_cache)  # isi bytecode cache
+    warm = time_compile(bytecode_cache)
+    print(f"Load semua template (worker baru) tanpa bytecode cache: {cold:.2f} ms | dengan bytecode cache: {warm:.2f} ms")
@@ -1,8 +1,9 @@
 import sys, os
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
-from app_toko import toko_app, db
+from app_toko import toko_app, db, upgrade_schema
 
 with toko_app.app_context():
     db.create_all()
+    upgrade_schema()
     print("Database initialized ✅")
\ No newline at end of file